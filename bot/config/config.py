@@ -23,6 +23,14 @@ class Settings(BaseSettings):
 
     ENABLE_PROXY: bool = True
 
+    ENABLE_LEDGER: bool = True
+    LEDGER_PATH: str = '../data/ledger.db'
+
+    NOFILE_LIMIT: int = 8192
+    MAX_OPEN_SOCKETS: int = 4096
+    SOCKETS_PER_SESSION: int = 2
+    RESOURCE_REPORT_INTERVAL: int = 600
+
 
 settings = Settings()
 
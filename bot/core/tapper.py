@@ -18,6 +18,8 @@ from tzlocal import get_localzone
 from bot.config import settings
 from bot.exceptions import InvalidSession
 from bot.utils import logger
+from bot.utils.ledger import ledger
+from bot.utils.resources import resources
 from .agents import generate_random_user_agent
 from .headers import headers
 from .profiles import profiles
@@ -37,11 +39,56 @@ def convert_to_local_and_unix(iso_time):
     unix_time = int(local_dt.timestamp())
     return unix_time
 
+class AccountState:
+    """Per-account loop state, kept compact so thousands of accounts stay cheap."""
+    __slots__ = ('token_expiration', 'access_token')
+
+    def __init__(self):
+        self.token_expiration = 0
+        self.access_token = None
+
 class Tapper:
+    __slots__ = ('session_name', 'tg_client', 'proxy', 'state', 'http_client', 'http_lease')
+
+    api_url = "https://{domain_name}-domain.blum.codes/api/v1"
+
     def __init__(self, tg_client: Client, proxy: str | None):
         self.session_name = tg_client.name
         self.tg_client = tg_client
         self.proxy = proxy
+        self.state = AccountState()
+        self.http_client = None
+        self.http_lease = None
+
+    async def create_http_client(self) -> aiohttp.ClientSession:
+        # The connector is owned by the session and capped at the reserved sockets, so closing the session frees them all
+        sockets = settings.SOCKETS_PER_SESSION
+        if self.proxy:
+            connector = ProxyConnector.from_url(self.proxy, limit=sockets)
+        else:
+            connector = aiohttp.TCPConnector(limit=sockets)
+        http_client = aiohttp.ClientSession(headers=headers, connector=connector)
+        if settings.FAKE_USERAGENT:
+            http_client.headers['User-Agent'] = generate_random_user_agent(device_type='android', browser_type='chrome')
+        # Sessions are recreated between rounds and after errors while the token is still valid
+        if self.state.access_token:
+            http_client.headers["Authorization"] = f"Bearer {self.state.access_token}"
+
+        try:
+            self.http_lease = await resources.acquire('proxy' if self.proxy else 'session', self.session_name, sockets,
+                                                      http_client, is_closed=lambda client: client.closed)
+        except BaseException:
+            await http_client.close()
+            raise
+        self.http_client = http_client
+        return http_client
+
+    async def close_http_client(self) -> None:
+        if self.http_client is not None and not self.http_client.closed:
+            await self.http_client.close()
+        resources.release(self.http_lease)
+        self.http_client = None
+        self.http_lease = None
 
     async def get_tg_web_data(self) -> str:
         import json
@@ -59,10 +106,14 @@ class Tapper:
 
         self.tg_client.proxy = proxy_dict
 
+        tg_lease = None
         try:
             if not self.tg_client.is_connected:
+                tg_lease = await resources.acquire('telegram', self.session_name, 1, self.tg_client,
+                                                   is_closed=lambda client: not client.is_connected, opened=False)
                 try:
                     await self.tg_client.connect()
+                    tg_lease.opened = True
 
                 except (Unauthorized, UserDeactivated, AuthKeyUnregistered):
                     raise InvalidSession(self.session_name)
@@ -93,9 +144,6 @@ class Tapper:
             tg_web_data_parts = tg_web_data.split('&')
             user = json.loads(tg_web_data_parts[0].split('=')[1])
             init_data = (f"user={user["id"]}")
-            
-            if self.tg_client.is_connected:
-                await self.tg_client.disconnect()
 
             return ref_id, init_data
 
@@ -104,15 +152,20 @@ class Tapper:
             await asyncio.sleep(delay=3)
             return None, None
 
+        finally:
+            if self.tg_client.is_connected:
+                await self.tg_client.disconnect()
+            resources.release(tg_lease)
+
     @error_handler
     async def make_request(self, http_client, method, endpoint=None, domain_name=None, url=None, **kwargs):
-        full_url = url or f"https://{domain_name}-domain.blum.codes/api/v1{endpoint or ''}"
+        full_url = url or f"{self.api_url.format(domain_name=domain_name)}{endpoint or ''}"
         response = await http_client.request(method, full_url, **kwargs)
         return await response.json()
         
     @error_handler
     async def login(self, http_client, user_data: str, ref_id: str):
-        response = await http_client.request("POST", "https://user-domain.blum.codes/api/v1/auth/provider/PROVIDER_TELEGRAM_MINI_APP", json={"query": profiles[self.session_name]["query"]})
+        response = await http_client.request("POST", f"{self.api_url.format(domain_name='user')}/auth/provider/PROVIDER_TELEGRAM_MINI_APP", json={"query": user_data})
         response_data = await response.json()
         if 'token' in response_data:
             return response_data['token']['refresh']
@@ -190,56 +243,42 @@ class Tapper:
             logger.info(f"{self.tg_client.name} | Bot will start in <light-red>{random_delay}s</light-red>")
             await asyncio.sleep(delay=random_delay)
         
-        proxy_conn = ProxyConnector().from_url(self.proxy) if self.proxy else None
-        http_client = aiohttp.ClientSession(headers=headers, connector=proxy_conn)
+        http_client = await self.create_http_client()
         if self.proxy:
             await self.check_proxy(http_client=http_client)
-        
-        if settings.FAKE_USERAGENT:            
-            http_client.headers['User-Agent'] = generate_random_user_agent(device_type='android', browser_type='chrome')
 
         # ``
         # Blum Farming Bot
         # ``
-        end_farming_dt = 0
-        token_expiration = 0
-        tickets = 0
-        next_stars_check = 0
-        next_combo_check = 0
+        state = self.state
         
         while True:
             try:
                 # set up proxy and client session
                 logger.info(f"{self.session_name} | Set up proxy and Client Session!")
                 if http_client.closed:
-                    if proxy_conn:
-                        if not proxy_conn.closed:
-                            proxy_conn.close()
-
-                    proxy_conn = ProxyConnector().from_url(self.proxy) if self.proxy else None
-                    http_client = aiohttp.ClientSession(headers=headers, connector=proxy_conn)
-                    if settings.FAKE_USERAGENT:            
-                        http_client.headers['User-Agent'] = generate_random_user_agent(device_type='android', browser_type='chrome')
+                    http_client = await self.create_http_client()
 
                 # get token and refresh after expired
                 logger.info(f"{self.session_name} | Get token and refresh after expired!")
                 timenow = time()
-                if timenow >= token_expiration:
-                    if (token_expiration != 0):
+                if timenow >= state.token_expiration:
+                    if (state.token_expiration != 0):
                         logger.warning(f"{self.session_name} | Token expired, refreshing...")
                     ref_id = profiles[self.session_name]["ref_id"]
                     user_data = profiles[self.session_name]["query"]
-                    access_token = await self.login(http_client=http_client, user_data=user_data, ref_id=ref_id)
+                    state.access_token = await self.login(http_client=http_client, user_data=user_data, ref_id=ref_id)
 
-                    if not access_token:
+                    if not state.access_token:
                         logger.error(f"{self.session_name} | Failed login")
+                        await self.close_http_client()
                         logger.info(f"{self.session_name} | Sleep <light-red>300s</light-red>")
                         await asyncio.sleep(delay=300)
                         continue
                     else:
                         logger.success(f"{self.session_name} | <light-red>🍅 Login successful</light-red>")
-                        http_client.headers["Authorization"] = f"Bearer {access_token}"
-                        token_expiration = timenow + 3600
+                        http_client.headers["Authorization"] = f"Bearer {state.access_token}"
+                        state.token_expiration = timenow + 3600
 
                 # Start farming
                 logger.info(f"{self.session_name} | Get go!")
@@ -250,6 +289,7 @@ class Tapper:
                 available_balance = balance['availableBalance']
                 farming_info = balance.get('farming')
                 logger.info(f"{self.session_name} | Current balance: <light-red>{available_balance}</light-red>")
+                ledger.record(self.session_name, 'balance', available_balance, play_passes=balance.get('playPasses'))
 
                 if 'farming' in balance:
                     end_time_ms = farming_info['endTime']
@@ -275,6 +315,7 @@ class Tapper:
                         logger.warning(f"{self.session_name} | Phần thưởng hàng ngày đã được nhận hôm nay")
                     elif 'message' in daily_reward_response and daily_reward_response['message'] == 'OK':
                         logger.success(f"{self.session_name} | Phần thưởng hàng ngày đã được nhận thành công!")
+                        ledger.record(self.session_name, 'daily_reward')
                     else:
                         logger.info(f"{self.session_name} | Không có phần thưởng nào để nhận!")
                 
@@ -284,6 +325,8 @@ class Tapper:
                     claim_response = await self.claim_farming(http_client=http_client)
                     if claim_response:
                         logger.success(f"{self.session_name} | Đã nhận: <light-red>{claim_response['availableBalance']}</light-red>")
+                        ledger.record(self.session_name, 'farming_claim', farming_info['balance'] if farming_info else None,
+                                      available_balance=claim_response['availableBalance'])
                         logger.info(f"{self.session_name} | Bắt đầu farming ...")
                         start_response = await self.start_farming(http_client=http_client)
                         if start_response:
@@ -304,6 +347,7 @@ class Tapper:
                         if 'claimBalance' in claim_friend_balance:
                             claimed_amount = claim_friend_balance['claimBalance']
                             logger.success(f"{self.session_name} | Nhận thành công: <light-red>{claimed_amount}</light-red>")
+                            ledger.record(self.session_name, 'friend_claim', claimed_amount)
                         else:
                             logger.warning(f"{self.session_name} | Không thể nhận số dư bạn bè")
                     else:
@@ -327,7 +371,7 @@ class Tapper:
                     logger.info(f"{self.session_name} | Đang kiểm tra game ...")
                     await asyncio.sleep(delay=1)
                     if 'gameId' in game_response:
-                        claim_response = await self.claim_game(http_client=http_client, game_id=game_response['gameId'], points=2000)
+                        game_claim = claim_response = await self.claim_game(http_client=http_client, game_id=game_response['gameId'], points=2000)
 
                         if claim_response is None:
                             logger.warning(f"{self.session_name} | Không thể nhận phần thưởng game, thử lại ...")
@@ -344,7 +388,7 @@ class Tapper:
                                 break
                             elif 'message' in claim_response and claim_response['message'] == 'Token is invalid':
                                 logger.warning(f"{self.session_name} | Token không hợp lệ, lấy token mới...")
-                                new_token = await self.get_new_token(http_client=http_client, old_refresh_token=access_token)
+                                new_token = await self.get_new_token(http_client=http_client, old_refresh_token=state.access_token)
                                 timenow = time()
 
                                 if not new_token:
@@ -353,11 +397,18 @@ class Tapper:
                                 else:
                                     logger.success(f"{self.session_name} | <light-red>🍅 Login successful</light-red>")
                                     http_client.headers["Authorization"] = f"Bearer {new_token}"
-                                    token_expiration = timenow + 3600
+                                    state.token_expiration = timenow + 3600
                                 continue
                             else:
                                 logger.info(f"{self.session_name} | Game kết thúc")
                                 break
+
+                        if game_claim is None:
+                            ledger.record(self.session_name, 'game', game_id=game_response['gameId'], outcome='failed')
+                        elif 'message' in game_claim:
+                            ledger.record(self.session_name, 'game', game_id=game_response['gameId'], outcome=game_claim['message'])
+                        else:
+                            ledger.record(self.session_name, 'game', 2000, game_id=game_response['gameId'], outcome='claimed')
                         
                         balance_new = await self.get_balance(http_client=http_client)
                         if balance_new['playPasses'] > 0:
@@ -371,21 +422,21 @@ class Tapper:
                         continue
 
                 balance_newest = await self.get_balance(http_client=http_client)
+                ledger.record(self.session_name, 'balance', balance_newest['availableBalance'], play_passes=balance_newest.get('playPasses'))
                 remain_farm_time = 10
                 if 'farming' in balance_newest:
                     remain_farm_time = round((balance_newest["farming"]["endTime"] - balance_newest["timestamp"])/1000.0)
 
+                # release sockets while sleeping, the next round opens a fresh session
+                await self.close_http_client()
                 logger.success(f'{self.session_name} | Sleep <light-red>{round(remain_farm_time/60)}m.</light-red>')
                 await asyncio.sleep(remain_farm_time)
-                await http_client.close()
-                if proxy_conn:
-                    if not proxy_conn.closed:
-                        proxy_conn.close()
             except InvalidSession as error:
                 raise error
 
             except Exception as error:
                 logger.error(f"{self.session_name} | Unknown error: {error}")
+                await self.close_http_client()
                 await asyncio.sleep(delay=3)
                 logger.info(f'{self.session_name} | Sleep <light-red>3m.</light-red>')
                 await asyncio.sleep(180)
@@ -402,7 +453,10 @@ async def run_tapper(tg_client: Client):
     else:
         proxy = None
 
+    tapper = Tapper(tg_client=tg_client, proxy=proxy)
     try:
-        await Tapper(tg_client=tg_client, proxy=proxy).run()
+        await tapper.run()
     except InvalidSession:
         logger.error(f"{tg_client.name} | Invalid Session")
+    finally:
+        await tapper.close_http_client()
@@ -9,6 +9,8 @@ from better_proxy import Proxy
 
 from bot.config import settings
 from bot.utils import logger
+from bot.utils.ledger import ledger
+from bot.utils.resources import resources, raise_nofile_limit
 from bot.core.tapper import run_tapper
 from bot.core.registrator import register_sessions
 
@@ -109,4 +111,19 @@ async def run_tasks(tg_clients: list[Client]):
         for tg_client in tg_clients
     ]
 
-    await asyncio.gather(*tasks)
+    nofile_limit = raise_nofile_limit(settings.NOFILE_LIMIT)
+    if nofile_limit is not None:
+        resources.fit_to_fd_limit(nofile_limit)
+    resources.start(interval=settings.RESOURCE_REPORT_INTERVAL)
+
+    try:
+        if settings.ENABLE_LEDGER:
+            try:
+                await ledger.start()
+            except Exception as error:
+                logger.error(f"Ledger | Can't open {ledger.path}, running without it: {error}")
+
+        await asyncio.gather(*tasks)
+    finally:
+        await ledger.stop()
+        await resources.stop()
@@ -0,0 +1,189 @@
+import os
+import json
+import asyncio
+import sqlite3
+import argparse
+from time import time
+
+from bot.config import settings
+from bot.utils import logger
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    session TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    amount REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_session_ts ON events (session, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+ACCOUNTS_QUERY = """
+SELECT session,
+       (SELECT amount FROM events AS b
+         WHERE b.session = e.session AND b.kind = 'balance'
+         ORDER BY b.ts DESC, b.id DESC LIMIT 1) AS balance,
+       SUM(CASE WHEN kind = 'farming_claim' THEN amount ELSE 0 END) AS farmed,
+       SUM(CASE WHEN kind = 'friend_claim' THEN amount ELSE 0 END) AS friends,
+       SUM(kind = 'game') AS games,
+       SUM(CASE WHEN kind = 'game' THEN amount ELSE 0 END) AS game_points,
+       SUM(kind = 'daily_reward') AS daily_rewards,
+       MAX(ts) AS last_seen
+  FROM events AS e
+ WHERE ts >= ? AND (? IS NULL OR session = ?)
+ GROUP BY session
+ ORDER BY session
+"""
+
+COLUMNS = ('session', 'balance', 'farmed', 'friends', 'games', 'game_points', 'daily_rewards', 'last_seen')
+
+_STOP = None
+
+
+def to_amount(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class Ledger:
+    """Write-behind event ledger: ``record`` only enqueues, a background task commits in batches."""
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._queue: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._conn: sqlite3.Connection | None = None
+
+    def record(self, session_name: str, kind: str, amount=None, **data) -> None:
+        # Amounts come straight from the API (often numeric strings), the writer converts them off the hot path
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait((time(), session_name, kind, amount, data))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self) -> None:
+        if self._writer is not None:
+            return
+        self._conn = await asyncio.to_thread(connect, self.path)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._writer = asyncio.create_task(self._write_behind(self._queue))
+        logger.info(f"Ledger | Writing events to <light-red>{self.path}</light-red>")
+
+    async def stop(self) -> None:
+        if self._writer is None:
+            return
+        queue, self._queue = self._queue, None
+        writer, self._writer = self._writer, None
+        if not writer.done():
+            # A full queue only drains while the writer is alive, so don't wait on the put if it dies
+            put = asyncio.ensure_future(queue.put(_STOP))
+            await asyncio.wait((put, writer), return_when=asyncio.FIRST_COMPLETED)
+            put.cancel()
+        try:
+            await writer
+        except asyncio.CancelledError:
+            if not writer.cancelled():
+                raise
+            logger.error(f"Ledger | Writer was cancelled, {queue.qsize()} events lost")
+        except Exception as error:
+            logger.error(f"Ledger | Writer stopped with an error, {queue.qsize()} events lost: {error}")
+        await asyncio.to_thread(self._conn.close)
+        self._conn = None
+        if self.dropped:
+            logger.warning(f"Ledger | Dropped <light-red>{self.dropped}</light-red> events, queue was full")
+
+    async def _write_behind(self, queue: asyncio.Queue) -> None:
+        while True:
+            batch = [await queue.get()]
+            if batch[0] is not _STOP:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and batch[-1] is not _STOP and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                try:
+                    await asyncio.to_thread(self._commit, batch)
+                except Exception as error:
+                    logger.error(f"Ledger | Failed to write {len(batch)} events: {error}")
+            if stop:
+                return
+
+    def _commit(self, batch: list) -> None:
+        rows = []
+        for ts, session, kind, amount, data in batch:
+            value = to_amount(amount)
+            if value is None and amount is not None:
+                # Keep what the API sent so unparsable amounts aren't silently lost
+                data['amount'] = str(amount)
+            rows.append((ts, session, kind, value, json.dumps(data) if data else None))
+
+        with self._conn:
+            self._conn.executemany("INSERT INTO events (ts, session, kind, amount, data) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+ledger = Ledger(path=settings.LEDGER_PATH)
+
+
+def query_accounts(conn: sqlite3.Connection, session_name: str | None = None, hours: float | None = None) -> list[dict]:
+    since = time() - hours * 3600 if hours else 0
+    rows = conn.execute(ACCOUNTS_QUERY, (since, session_name, session_name)).fetchall()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+def fleet_totals(accounts: list[dict]) -> dict:
+    totals = {'accounts': len(accounts)}
+    for column in COLUMNS[1:-1]:
+        totals[column] = sum(account[column] or 0 for account in accounts)
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query balances and events recorded by the bot")
+    parser.add_argument("view", choices=["accounts", "fleet"], help="Per-account or fleet-wide totals")
+    parser.add_argument("-s", "--session", help="Only this session")
+    parser.add_argument("--hours", type=float, help="Only events from the last N hours")
+    parser.add_argument("--db", default=settings.LEDGER_PATH, help="Ledger database path")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        parser.error(f"ledger database {args.db} not found, run the clicker with ENABLE_LEDGER or pass --db")
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    accounts = query_accounts(conn, session_name=args.session, hours=args.hours)
+    conn.close()
+
+    if args.view == "fleet":
+        for name, value in fleet_totals(accounts).items():
+            print(f"{name:>14}: {value:g}")
+        return
+
+    print(" | ".join(f"{column:>14}" for column in COLUMNS[:-1]))
+    for account in accounts:
+        print(" | ".join(f"{account[column] if account[column] is not None else '-':>14}" for column in COLUMNS[:-1]))
+
+
+if __name__ == '__main__':
+    main()
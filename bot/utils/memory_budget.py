@@ -0,0 +1,294 @@
+import gc
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+from collections import Counter
+from time import time
+from unittest import mock
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from aiohttp import web
+from pyrogram import Client
+
+from bot.config import settings
+from bot.utils import logger
+from bot.core import tapper as tapper_module
+from bot.core.tapper import Tapper, AccountState
+from bot.utils.ledger import ledger
+from bot.utils.resources import resources
+
+
+DEFAULT_ACCOUNTS = 50
+DEFAULT_ROUNDS = 3
+# Measured ~25 KiB per account, idle or active, plus headroom; re-baseline when the per-account footprint changes on purpose
+DEFAULT_MAX_BYTES_PER_ACCOUNT = 48 * 1024
+TOP_ALLOCATORS = 10
+TOP_TYPES = 15
+
+LOGIN_PATH = "/user/api/v1/auth/provider/PROVIDER_TELEGRAM_MINI_APP"
+BALANCE_PATH = "/game/api/v1/user/balance"
+PLAY_PATH = "/game/api/v1/game/play"
+
+
+def _stub_responses() -> dict:
+    return {
+        ("GET", "/game/api/v1/daily-reward"): {"message": "same day"},
+        ("POST", "/game/api/v1/farming/claim"): {"availableBalance": "100.00"},
+        ("POST", "/game/api/v1/farming/start"): {},
+        ("GET", "/user/api/v1/friends/balance"): {"canClaim": True, "amountForClaim": "1.00"},
+        ("POST", "/user/api/v1/friends/claim"): {"claimBalance": "1.00"},
+        ("POST", PLAY_PATH): {"gameId": "00000000-0000-0000-0000-000000000000"},
+        ("POST", "/game/api/v1/game/claim"): {},
+    }
+
+
+def _serve(port_queue) -> None:
+    """Local stand-in for the Blum API, run in its own process so it stays out of the measurements."""
+    responses = _stub_responses()
+    # Tokens that just played, so the balance check right after a game reports no passes left
+    played = set()
+
+    async def handler(request: web.Request) -> web.Response:
+        token = request.headers.get("Authorization")
+        if request.path == LOGIN_PATH:
+            query = (await request.json())["query"]
+            return web.json_response({"token": {"access": query, "refresh": query}})
+        if request.path == BALANCE_PATH:
+            now = int(time() * 1000)
+            play_passes = 0 if token in played else 1
+            played.discard(token)
+            # Farming has always just ended, so every round claims it and restarts it
+            return web.json_response({
+                "availableBalance": "100.00",
+                "playPasses": play_passes,
+                "timestamp": now,
+                "farming": {"startTime": now, "endTime": now, "balance": "1.00"},
+            })
+        if request.path == PLAY_PATH:
+            played.add(token)
+        return web.json_response(responses.get((request.method, request.path), {}))
+
+    async def main():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def get_rss() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        if resource is None:
+            return 0
+        # ru_maxrss is a high-water mark in KiB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def count_objects() -> Counter:
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+class Sample:
+    __slots__ = ('rss', 'snapshot', 'objects')
+
+    def __init__(self):
+        gc.collect()
+        self.rss = get_rss()
+        self.snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        self.objects = count_objects()
+
+
+class RoundsDone(BaseException):
+    ...
+
+
+class BenchTapper(Tapper):
+    __slots__ = ('rounds_left', 'held')
+
+    # Set by run_budget once the live accounts have been sampled
+    resume: asyncio.Event
+
+    def __init__(self, tg_client: Client, proxy: str | None, rounds: int = 0):
+        super().__init__(tg_client=tg_client, proxy=proxy)
+        self.rounds_left = rounds
+        self.held = asyncio.Event()
+
+    async def close_http_client(self) -> None:
+        # Tapper.run closes its session at the end of every round. In the last round, hold the account here
+        # with its session, lease and run frame still alive until it has been sampled, then stop it
+        if self.rounds_left == 1:
+            self.held.set()
+            await self.resume.wait()
+        await super().close_http_client()
+        self.rounds_left -= 1
+        if self.rounds_left == 0:
+            raise RoundsDone(self.session_name)
+
+
+_sleep = asyncio.sleep
+
+
+async def _fast_sleep(delay, result=None):
+    return await _sleep(0, result)
+
+
+def make_tapper(index: int, kind: str, rounds: int = 0) -> BenchTapper:
+    tg_client = Client(
+        name=f"bench_{kind}_{index}",
+        api_id=settings.API_ID,
+        api_hash=settings.API_HASH,
+        in_memory=True,
+        no_updates=True,
+    )
+    return BenchTapper(tg_client=tg_client, proxy=None, rounds=rounds)
+
+
+async def drive_account(tapper: BenchTapper) -> None:
+    try:
+        await tapper.run()
+    except RoundsDone:
+        pass
+    finally:
+        # Never leave run_budget waiting on an account whose run ended some other way
+        tapper.held.set()
+
+
+def report(label: str, before: Sample, after: Sample, accounts: int) -> int:
+    stats = after.snapshot.compare_to(before.snapshot, "lineno")
+    traced = sum(stat.size_diff for stat in stats)
+    per_account = traced // accounts
+    rss_per_account = (after.rss - before.rss) // accounts
+
+    logger.info(f"<light-red>{label}</light-red> | {accounts} accounts | "
+                f"traced <light-red>{per_account}</light-red> B/account | RSS {rss_per_account} B/account")
+
+    logger.info(f"{label} | Top allocators:")
+    for stat in stats[:TOP_ALLOCATORS]:
+        frame = stat.traceback[0]
+        logger.info(f"{label} |   {frame.filename}:{frame.lineno} "
+                    f"{stat.size_diff // accounts} B/account ({stat.count_diff} blocks)")
+
+    logger.info(f"{label} | Objects by type per account:")
+    objects = after.objects - before.objects
+    for name, count in objects.most_common(TOP_TYPES):
+        logger.info(f"{label} |   {name}: {count / accounts:.1f}")
+
+    return per_account
+
+
+def check_slots() -> bool:
+    ok = True
+    for cls, instance in ((AccountState, AccountState()), (Tapper, Tapper.__new__(Tapper))):
+        if hasattr(instance, "__dict__"):
+            logger.error(f"{cls.__name__} has grown a __dict__, per-account state is no longer slotted")
+            ok = False
+        else:
+            logger.info(f"{cls.__name__} | {sys.getsizeof(instance)} B/instance (slotted)")
+    return ok
+
+
+async def run_budget(accounts: int, rounds: int, max_bytes: int) -> bool:
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(port_queue,), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+    BenchTapper.api_url = f"http://127.0.0.1:{port}/{{domain_name}}/api/v1"
+    BenchTapper.resume = asyncio.Event()
+    # Idle accounts hold their sessions for the whole run, make sure the socket budget never queues them
+    resources.budget = max(resources.budget, 2 * accounts * settings.SOCKETS_PER_SESSION)
+
+    # Active accounts run the real Tapper.run loop with every sleep cut to a single event loop turn
+    profiles = {
+        f"bench_active_{index}": {"query": f"query_id=bench_active_{index}", "ref_id": settings.REF_ID, "proxy": ""}
+        for index in range(accounts)
+    }
+
+    idle, active, tasks = [], [], []
+    with tempfile.TemporaryDirectory() as workdir, \
+            mock.patch.dict(tapper_module.profiles, profiles), \
+            mock.patch.object(settings, "USE_RANDOM_DELAY_IN_RUN", False), \
+            mock.patch("asyncio.sleep", _fast_sleep):
+        ledger.path = os.path.join(workdir, "ledger.db")
+        await ledger.start()
+        try:
+            tracemalloc.start()
+            baseline = Sample()
+
+            for index in range(accounts):
+                tapper = make_tapper(index, "idle")
+                await tapper.create_http_client()
+                idle.append(tapper)
+            after_idle = Sample()
+
+            active = [make_tapper(index, "active", rounds=max(rounds, 1)) for index in range(accounts)]
+            tasks = [asyncio.create_task(drive_account(tapper)) for tapper in active]
+            await asyncio.gather(*(tapper.held.wait() for tapper in active))
+            after_active = Sample()
+
+            BenchTapper.resume.set()
+            await asyncio.gather(*tasks)
+            after_finished = Sample()
+
+            tracemalloc.stop()
+
+            idle_bytes = report("Idle", baseline, after_idle, accounts)
+            active_bytes = report("Active", after_idle, after_active, accounts)
+            # What finished accounts leave behind, should stay near zero
+            report("Finished", after_idle, after_finished, accounts)
+        finally:
+            BenchTapper.resume.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for tapper in idle + active:
+                tapper.rounds_left = -1
+                await tapper.close_http_client()
+            await ledger.stop()
+            server.terminate()
+            server.join()
+
+    ok = check_slots()
+    for label, per_account in (("Idle", idle_bytes), ("Active", active_bytes)):
+        if per_account > max_bytes:
+            logger.error(f"{label} accounts use {per_account} B/account, budget is {max_bytes} B/account")
+            ok = False
+        else:
+            logger.success(f"{label} accounts within budget: {per_account}/{max_bytes} B/account")
+
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure memory per account and fail on budget regressions")
+    parser.add_argument("-n", "--accounts", type=int, default=DEFAULT_ACCOUNTS, help="Number of idle and of active accounts")
+    parser.add_argument("-r", "--rounds", type=int, default=DEFAULT_ROUNDS, help="Rounds of Tapper.run per active account")
+    parser.add_argument("-m", "--max-bytes-per-account", type=int, default=DEFAULT_MAX_BYTES_PER_ACCOUNT,
+                        help="Fail when traced bytes per account exceed this")
+    args = parser.parse_args()
+
+    ok = asyncio.run(run_budget(accounts=args.accounts, rounds=args.rounds, max_bytes=args.max_bytes_per_account))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
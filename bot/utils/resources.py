@@ -0,0 +1,194 @@
+import os
+import asyncio
+import weakref
+from collections import Counter, deque
+from time import time
+from typing import Any, Callable
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bot.config import settings
+from bot.utils import logger
+
+
+# File descriptors kept free for SQLite, log files, session files and Pyrogram beyond the socket budget
+FD_HEADROOM = 64
+
+
+def raise_nofile_limit(ceiling: int) -> int | None:
+    """Raise the soft RLIMIT_NOFILE up to ``ceiling`` (capped by the hard limit) and return the new soft limit,
+    or None when there is no limit to fit into."""
+    if resource is None:
+        return None
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return None
+    target = ceiling if hard == resource.RLIM_INFINITY else min(ceiling, hard)
+    if soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            logger.info(f"Resources | Raised open files limit from {soft} to <light-red>{target}</light-red>")
+            soft = target
+        except (ValueError, OSError) as error:
+            logger.warning(f"Resources | Can't raise open files limit from {soft} to {target}: {error}")
+    return soft
+
+
+def count_open_fds() -> int | None:
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+class Lease:
+    __slots__ = ('kind', 'owner', 'sockets', 'opened_at', 'ref', 'is_closed', 'opened', 'released')
+
+    def __init__(self, kind: str, owner: str, sockets: int, ref: weakref.ref, is_closed: Callable[[Any], bool],
+                 opened: bool = True):
+        self.kind = kind
+        self.owner = owner
+        self.sockets = sockets
+        self.opened_at = time()
+        self.ref = ref
+        self.is_closed = is_closed
+        # Owners reserve before connecting; until they report the connection is open, "closed" isn't a leak
+        self.opened = opened
+        self.released = False
+
+
+class ResourceManager:
+    """Process-wide socket budget. Owners wait in FIFO order for free sockets instead of failing with EMFILE."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.in_use = 0
+        self.leaked = Counter()
+        self._leases: set[Lease] = set()
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        self._reporter: asyncio.Task | None = None
+
+    def fit_to_fd_limit(self, limit: int) -> None:
+        if limit < 0:  # RLIM_INFINITY
+            return
+        budget = max(1, min(self.budget, limit - FD_HEADROOM))
+        if budget < self.budget:
+            logger.warning(f"Resources | Open files limit is {limit}, "
+                           f"lowering socket budget from {self.budget} to <light-red>{budget}</light-red>")
+            self.budget = budget
+            self._wake()
+
+    async def acquire(self, kind: str, owner: str, sockets: int, obj: Any, is_closed: Callable[[Any], bool],
+                      opened: bool = True) -> Lease:
+        sockets = min(sockets, self.budget)
+        if self._waiters or self.in_use + sockets > self.budget:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((sockets, future))
+            logger.debug(f"{owner} | Waiting for {sockets} sockets ({self.in_use}/{self.budget} in use)")
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.in_use -= sockets
+                    self._wake()
+                raise
+        else:
+            self.in_use += sockets
+
+        lease = Lease(kind, owner, sockets, None, is_closed, opened)
+        lease.ref = weakref.ref(obj, lambda _: self._collected(lease))
+        self._leases.add(lease)
+        return lease
+
+    def release(self, lease: Lease | None) -> None:
+        if lease is None or lease.released:
+            return
+        lease.released = True
+        self._leases.discard(lease)
+        self.in_use -= lease.sockets
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            sockets, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.in_use + sockets > self.budget:
+                break
+            self._waiters.popleft()
+            self.in_use += sockets
+            future.set_result(None)
+
+    def _collected(self, lease: Lease) -> None:
+        if lease.released:
+            return
+        self.leaked[lease.kind] += 1
+        logger.warning(f"{lease.owner} | Leaked {lease.kind}: garbage collected without being released")
+        self.release(lease)
+
+    def find_leaks(self) -> list[Lease]:
+        leaks = []
+        for lease in list(self._leases):
+            obj = lease.ref()
+            if obj is not None and lease.opened and lease.is_closed(obj):
+                leaks.append(lease)
+        return leaks
+
+    def report(self) -> None:
+        by_kind = Counter()
+        by_owner = Counter()
+        for lease in self._leases:
+            by_kind[lease.kind] += lease.sockets
+            by_owner[lease.owner] += lease.sockets
+
+        open_fds = count_open_fds()
+        kinds = ", ".join(f"{kind}={sockets}" for kind, sockets in sorted(by_kind.items())) or "-"
+        logger.info(f"Resources | Sockets <light-red>{self.in_use}/{self.budget}</light-red> ({kinds}) | "
+                    f"waiting {len(self._waiters)} | open fds {open_fds}")
+        if open_fds is not None and open_fds > self.in_use + FD_HEADROOM:
+            logger.warning(f"Resources | {open_fds} fds open but only {self.in_use} sockets reserved, "
+                           f"{open_fds - self.in_use - FD_HEADROOM} fds are held by untracked owners")
+
+        owners = ", ".join(f"{owner}={sockets}" for owner, sockets in by_owner.most_common(5))
+        if owners:
+            logger.info(f"Resources | Top owners: {owners}")
+
+        for lease in self.find_leaks():
+            self.leaked[lease.kind] += 1
+            logger.warning(f"{lease.owner} | Leaked {lease.kind}: closed {int(time() - lease.opened_at)}s "
+                           f"after opening but never released, reclaiming {lease.sockets} sockets")
+            self.release(lease)
+
+        if self.leaked:
+            leaked = ", ".join(f"{kind}={count}" for kind, count in sorted(self.leaked.items()))
+            logger.warning(f"Resources | Leaks since start: {leaked}")
+
+    async def _report_periodically(self, interval: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
+
+    def start(self, interval: int) -> None:
+        if self._reporter is None and interval > 0:
+            self._reporter = asyncio.create_task(self._report_periodically(interval))
+
+    async def stop(self) -> None:
+        if self._reporter is None:
+            return
+        self._reporter.cancel()
+        try:
+            await self._reporter
+        except asyncio.CancelledError:
+            pass
+        self._reporter = None
+        self.report()
+
+
+resources = ResourceManager(budget=settings.MAX_OPEN_SOCKETS)